@@ -2,303 +2,662 @@
 
 import sys
 import yaml
-import xml.etree.ElementTree as ET
 import argparse
 import os
+import io
+from copy import deepcopy
+from types import MappingProxyType
 
-def yaml_type_to_xsd_type(yaml_type):
-    mapping = {
-        "string": "xs:string",
-        "integer": "xs:int",
-        "boolean": "xs:boolean",
-        "number": "xs:decimal",
-        "array": "xs:sequence",
-        "object": "xs:complexType"
-    }
-    return mapping.get(yaml_type, "xs:string")
+try:
+    from lxml import etree as ET
+    USING_LXML = True
+except ImportError:
+    import xml.etree.ElementTree as ET
+    USING_LXML = False
+
+try:
+    from yaml import CSafeLoader as _Loader
+except ImportError:
+    from yaml import SafeLoader as _Loader
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+XS_NAMESPACE = "http://www.w3.org/2001/XMLSchema"
+if USING_LXML:
+    # lxml rejects prefixed tag names; namespaced tags are written with the registered prefix
+    ET.register_namespace('xs', XS_NAMESPACE)
+    XS_TAG = '{%s}%%s' % XS_NAMESPACE
+    XS_SCHEMA_ATTRIB = {'elementFormDefault': "qualified"}
+else:
+    # ElementTree writes prefixed tags as they are, the schema element declares the prefix
+    XS_TAG = 'xs:%s'
+    XS_SCHEMA_ATTRIB = {'xmlns:xs': XS_NAMESPACE, 'elementFormDefault': "qualified"}
+
+XS_SCHEMA = sys.intern(XS_TAG % 'schema')
+XS_ELEMENT = sys.intern(XS_TAG % 'element')
+XS_COMPLEX_TYPE = sys.intern(XS_TAG % 'complexType')
+XS_SEQUENCE = sys.intern(XS_TAG % 'sequence')
+XS_SIMPLE_TYPE = sys.intern(XS_TAG % 'simpleType')
+XS_RESTRICTION = sys.intern(XS_TAG % 'restriction')
+XS_ENUMERATION = sys.intern(XS_TAG % 'enumeration')
+XS_CHOICE = sys.intern(XS_TAG % 'choice')
+
+# Attribute values repeated on most generated elements
+XS_STRING = sys.intern('xs:string')
+UNBOUNDED = sys.intern('unbounded')
+
+YAML_TO_XSD_TYPES = {
+    "string": XS_STRING,
+    "integer": sys.intern("xs:int"),
+    "boolean": sys.intern("xs:boolean"),
+    "number": sys.intern("xs:decimal"),
+    "array": sys.intern("xs:sequence"),
+    "object": sys.intern("xs:complexType")
+}
+
+# Shared read-only default for lookups of optional spec keys
+_EMPTY = MappingProxyType({})
+
+SCHEMA_REF_PREFIX = '#/components/schemas/'
+
+# Schema names by full $ref string, the same refs recur throughout a spec; cleared for every generated schema
+_ref_names = {}
+
+def ref_name_from_path(ref_path):
+    ref_name = _ref_names.get(ref_path)
+    if ref_name is None:
+        ref_name = sys.intern(ref_path[ref_path.rfind('/') + 1:])
+        _ref_names[ref_path] = ref_name
+    return ref_name
+
+# Enum restrictions by base type and values; the same enum recurs across a spec, so each
+# distinct one is built once and copied, which is much cheaper than rebuilding it
+_enum_cache = {}
 
 def create_enum_restriction(element_type, enum_values):
-    restriction = ET.Element('xs:restriction', base=element_type)
+    cache_key = (element_type, tuple(enum_values))
+    cached = _enum_cache.get(cache_key)
+    if cached is None:
+        cached = _enum_cache[cache_key] = build_enum_restriction(element_type, enum_values)
+    return deepcopy(cached)
+
+def build_enum_restriction(element_type, enum_values):
+    restriction = ET.Element(XS_RESTRICTION, {'base': element_type})
     for value in enum_values:
-        ET.SubElement(restriction, 'xs:enumeration', value=value)
-    simple_type = ET.Element('xs:simpleType')
+        ET.SubElement(restriction, XS_ENUMERATION, {'value': value})
+    simple_type = ET.Element(XS_SIMPLE_TYPE)
     simple_type.append(restriction)
     return simple_type
 
+def add_parameter_schema_refs(parameters, openapi_spec, used_types_add):
+    for parameter in parameters:
+        if '$ref' in parameter:
+            parameter = resolve_ref(parameter['$ref'], openapi_spec)
+        if 'schema' in parameter:
+            schema = parameter['schema']
+            schema_ref = schema.get('$ref') or schema.get('items', _EMPTY).get('$ref')
+            if schema_ref:
+                used_types_add(ref_name_from_path(schema_ref))
+
 def find_request_body_only_types(openapi_spec):
+    # Types referenced by a request body and by no response or parameter
     request_body_types = set()
-    schemas = openapi_spec.get('components', {}).get('schemas', {}).keys()
+    used_types = set()
+    request_body_types_add = request_body_types.add
+    used_types_add = used_types.add
+    schemas = set(openapi_spec.get('components', _EMPTY).get('schemas', _EMPTY))
 
-    paths = openapi_spec.get('paths', {})
+    # Single walk over all operations collecting request body refs and the
+    # refs used by responses and parameters at the same time
+    paths = openapi_spec.get('paths', _EMPTY)
     for path_data in paths.values():
+        # Parameters shared by all operations of a path sit next to the operations
+        if 'parameters' in path_data:
+            add_parameter_schema_refs(path_data['parameters'], openapi_spec, used_types_add)
         for method_data in path_data.values():
-            request_body = method_data.get('requestBody', {})
-            content = request_body.get('content', {})
-            for media_type_data in content.values():
-                schema_ref = media_type_data.get('schema', {}).get('$ref')
-                if schema_ref:
-                    schema_name = schema_ref.split('/')[-1]
-                    if schema_name in schemas:
-                        request_body_types.add(schema_name)
-    return request_body_types
+            if not isinstance(method_data, dict):
+                continue
+            if 'requestBody' in method_data:
+                request_body = method_data['requestBody']
+                if '$ref' in request_body:
+                    request_body = resolve_ref(request_body['$ref'], openapi_spec)
+                for media_type_data in request_body.get('content', _EMPTY).values():
+                    if 'schema' in media_type_data:
+                        schema_ref = media_type_data['schema'].get('$ref')
+                        if schema_ref:
+                            request_body_types_add(ref_name_from_path(schema_ref))
+            if 'responses' in method_data:
+                for response in method_data['responses'].values():
+                    if '$ref' in response:
+                        response = resolve_ref(response['$ref'], openapi_spec)
+                    for media_type_data in response.get('content', _EMPTY).values():
+                        if 'schema' in media_type_data:
+                            schema = media_type_data['schema']
+                            schema_ref = schema.get('$ref') or schema.get('items', _EMPTY).get('$ref')
+                            if schema_ref:
+                                used_types_add(ref_name_from_path(schema_ref))
+            if 'parameters' in method_data:
+                add_parameter_schema_refs(method_data['parameters'], openapi_spec, used_types_add)
+    return (request_body_types - used_types) & schemas
+
+def collect_schema_references(schemas):
+    references = {}
+    for schema_name, schema_details in schemas.items():
+        refs = []
+        stack = [schema_details]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, dict):
+                ref_path = node.get('$ref')
+                if isinstance(ref_path, str):
+                    refs.append(ref_name_from_path(ref_path))
+                stack.extend(node.values())
+            elif isinstance(node, list):
+                stack.extend(node)
+        references[schema_name] = refs
+    return references
+
+def find_rarely_referenced_types(openapi_spec, max_references):
+    # Non-recursive types referenced at most max_references times are cheap to inline
+    schemas = openapi_spec.get('components', _EMPTY).get('schemas', _EMPTY)
+    references = collect_schema_references(schemas)
+    counts = {}
+    for refs in references.values():
+        for ref_name in refs:
+            counts[ref_name] = counts.get(ref_name, 0) + 1
+
+    candidates = set()
+    for schema_name, count in counts.items():
+        if schema_name not in schemas or count > max_references:
+            continue
+        seen = set()
+        stack = list(references[schema_name])
+        while stack:
+            ref_name = stack.pop()
+            if ref_name == schema_name:
+                break
+            if ref_name not in seen:
+                seen.add(ref_name)
+                stack.extend(references.get(ref_name, ()))
+        else:
+            candidates.add(schema_name)
+    return candidates
+
+def collect_inlined_references(schema_name, openapi_spec):
+    # The refs the builders follow when schema_name is expanded, walked the way build_inline_schema
+    # and process_properties walk it; allOf bases and other refs they never inline are skipped
+    node = get_schema_node(schema_name, openapi_spec)
+    refs = []
+    if node.type == 'string' and node.enum is not None:
+        return refs
+    if node.type == 'object':
+        stack = [node.merged_properties]
+    elif node.type == 'array':
+        stack = []
+        if node.items_ref is not None:
+            refs.append(node.items_ref)
+        elif node.items.get('type', 'string') == 'object':
+            stack.append(node.items.get('properties', _EMPTY))
+    else:
+        return refs
+
+    while stack:
+        for prop_details in stack.pop().values():
+            if 'allOf' in prop_details:
+                merged_properties, _, _ = merge_all_of_schemas(prop_details['allOf'], openapi_spec)
+                stack.append(merged_properties)
+                stack.append(prop_details.get('properties', _EMPTY))
+            elif 'anyOf' in prop_details:
+                for option in flatten_composition(prop_details['anyOf'], 'anyOf'):
+                    if '$ref' in option:
+                        refs.append(ref_name_from_path(option['$ref']))
+            elif '$ref' in prop_details:
+                refs.append(ref_name_from_path(prop_details['$ref']))
+            else:
+                prop_type = prop_details.get('type', 'string')
+                if prop_type == 'array':
+                    items = prop_details.get('items', _EMPTY)
+                    if '$ref' in items:
+                        refs.append(ref_name_from_path(items['$ref']))
+                    elif items.get('type', 'string') == 'object':
+                        stack.append(items.get('properties', _EMPTY))
+                elif prop_type == 'object':
+                    stack.append(prop_details.get('properties', _EMPTY))
+    return refs
+
+class ExpansionCycleError(ValueError):
+    # Raised before any output is written when types to expand inline refer to each other in a cycle
+    pass
+
+def find_expansion_cycle(openapi_spec, expand_list):
+    # Expanded types are inlined at every use, so a reference cycle among them would never end
+    schemas = openapi_spec.get('components', _EMPTY).get('schemas', _EMPTY)
+    references = {name: collect_inlined_references(name, openapi_spec) for name in sorted(expand_list) if name in schemas}
+    state = {}
+    for start in references:
+        if start in state:
+            continue
+        # Iterative depth-first search; state is 1 while a type is on the path and 2 once finished
+        path = [start]
+        state[start] = 1
+        pending = [iter(references[start])]
+        while pending:
+            for ref_name in pending[-1]:
+                if ref_name not in references:
+                    continue
+                ref_state = state.get(ref_name)
+                if ref_state == 1:
+                    return path[path.index(ref_name):] + [ref_name]
+                if ref_state is None:
+                    state[ref_name] = 1
+                    path.append(ref_name)
+                    pending.append(iter(references[ref_name]))
+                    break
+            else:
+                state[path.pop()] = 2
+                pending.pop()
+    return None
+
+def flatten_composition(options, keyword):
+    # Inline members that are themselves anyOf/allOf lists of the same keyword are hoisted
+    # into the parent list, so nesting does not add a level of scaffolding to the XSD
+    if not any(keyword in option and '$ref' not in option for option in options):
+        return options
+    flattened = []
+    # Entries are (option, hoisted); a hoisted allOf member only contributes its own properties
+    stack = [(option, False) for option in reversed(options)]
+    while stack:
+        option, hoisted = stack.pop()
+        if not hoisted and keyword in option and '$ref' not in option and 'oneOf' not in option:
+            # allOf members keep their own properties, placed after the hoisted nested members
+            # so that they take precedence when merged, as a property's own fields do
+            if keyword == 'allOf':
+                stack.append((option, True))
+            stack.extend((member, False) for member in reversed(option[keyword]))
+        else:
+            flattened.append(option)
+    return flattened
+
+# Merged allOf lists by id, holding the list itself so the id stays valid; cleared for every generated schema
+_all_of_cache = {}
 
 def merge_all_of_schemas(all_of_list, openapi_spec):
+    # Results are shared between callers and must not be modified
+    if not all_of_list:
+        return _EMPTY, frozenset(), ()
+    cached = _all_of_cache.get(id(all_of_list))
+    if cached is not None and cached[0] is all_of_list:
+        return cached[1]
+
     merged_properties = {}
-    required_fields = []
+    required_fields = set()
     references = []
-    for schema in all_of_list:
+    for schema in flatten_composition(all_of_list, 'allOf'):
         if '$ref' in schema:
-            ref_name = schema['$ref'].split('/')[-1]
+            ref_name = ref_name_from_path(schema['$ref'])
             references.append(ref_name)
         else:
-            ref_properties, ref_required = process_ref_or_schema(schema, openapi_spec)
-            merged_properties.update(ref_properties)
-            required_fields.extend(ref_required)
-    return merged_properties, list(set(required_fields)), references
-
-def process_ref_or_schema(schema, openapi_spec):
-    if '$ref' in schema:
-        ref_schema = resolve_ref(schema['$ref'], openapi_spec)
-        if 'allOf' in ref_schema:
-            return merge_all_of_schemas(ref_schema['allOf'], openapi_spec)
-        return ref_schema.get('properties', {}), ref_schema.get('required', [])
-    return schema.get('properties', {}), schema.get('required', [])
+            # Inline schemas carry their own properties, no ref resolution needed
+            merged_properties |= schema.get('properties', _EMPTY)
+            required_fields.update(schema.get('required', ()))
+    merged = merged_properties, frozenset(required_fields), tuple(references)
+    _all_of_cache[id(all_of_list)] = (all_of_list, merged)
+    return merged
+
+class SchemaNode:
+    # The fields of a component schema read by the XSD builders, extracted once per run
+    __slots__ = ('type', 'enum', 'items', 'items_ref', 'properties', 'required', 'references', 'merged_properties', 'merged_required')
+
+    def __init__(self, schema_details, openapi_spec):
+        self.type = schema_details.get('type', 'object')
+        self.enum = schema_details.get('enum')
+        self.items = schema_details.get('items', _EMPTY)
+        self.items_ref = ref_name_from_path(self.items['$ref']) if '$ref' in self.items else None
+        self.properties = schema_details.get('properties', _EMPTY)
+        self.required = frozenset(schema_details.get('required', ()))
+        all_of_properties, all_of_required, self.references = merge_all_of_schemas(schema_details.get('allOf', ()), openapi_spec)
+        # Own properties merged with those of the inline allOf members, used when expanding
+        self.merged_properties = {**self.properties, **all_of_properties}
+        self.merged_required = self.required.union(all_of_required)
+
+# Parsed named component schemas; cleared for every generated schema
+_schema_node_cache = {}
+
+def get_schema_node(schema_name, openapi_spec):
+    cache_key = (id(openapi_spec), schema_name)
+    node = _schema_node_cache.get(cache_key)
+    if node is None:
+        schemas = openapi_spec.get('components', _EMPTY).get('schemas', _EMPTY)
+        node = SchemaNode(schemas.get(schema_name, _EMPTY), openapi_spec)
+        _schema_node_cache[cache_key] = node
+    return node
 
 def load_list_from_input(input_value):
     if input_value is None:
-        return set()
+        return frozenset()
     if os.path.isfile(input_value):
         with open(input_value, 'r') as file:
-            return set(line.strip() for line in file if line.strip())
+            return frozenset(line.strip() for line in file if line.strip())
     else:
-        return set(input_value.split(','))
+        return frozenset(part.strip() for part in input_value.split(',') if part.strip())
+
+def load_openapi_from_stream(stream):
+    # JSON documents skip the YAML parser, JSON being much faster to parse
+    head = stream.peek(64).lstrip()
+    if head.startswith(b'{'):
+        document = stream.read()
+        try:
+            return json_loads(document)
+        except ValueError:
+            # Not JSON after all, e.g. a YAML flow mapping with unquoted keys
+            return yaml.load(document, Loader=_Loader)
+    return yaml.load(stream, Loader=_Loader)
 
 def load_openapi_from_file_or_stdin(input_file):
     if input_file:
-        with open(input_file, 'r') as file:
-            return yaml.safe_load(file)
+        # Binary mode lets the YAML reader detect the encoding and decode in C
+        with open(input_file, 'rb') as file:
+            return load_openapi_from_stream(file)
     else:
-        return yaml.safe_load(sys.stdin.read())
+        return load_openapi_from_stream(sys.stdin.buffer)
+
+# Inlined subtrees by spec, expand list and schema name; cleared for every generated schema.
+# The cached subtree is never attached to a parent, every caller gets its own copy
+_inline_cache = {}
 
 def inline_schema(schema_name, openapi_spec, expand_list):
-    schemas = openapi_spec.get('components', {}).get('schemas', {})
-    schema_details = schemas.get(schema_name, {})
-    schema_type = schema_details.get('type', 'object')
+    cache_key = (id(openapi_spec), id(expand_list), schema_name)
+    cached = _inline_cache.get(cache_key)
+    if cached is None:
+        cached = _inline_cache[cache_key] = build_inline_schema(schema_name, openapi_spec, expand_list)
+    return deepcopy(cached)
+
+def is_inlined(schema_name, openapi_spec, expand_list):
+    # Whether schema_name has been inlined anywhere since the caches were last cleared
+    return (id(openapi_spec), id(expand_list), schema_name) in _inline_cache
+
+def build_inline_schema(schema_name, openapi_spec, expand_list):
+    node = get_schema_node(schema_name, openapi_spec)
+    schema_type = node.type
 
-    if schema_type == 'string' and 'enum' in schema_details:
-        return create_enum_restriction('xs:string', schema_details['enum'])
+    if schema_type == 'string' and node.enum is not None:
+        return create_enum_restriction(XS_STRING, node.enum)
     elif schema_type == 'object':
-        properties = schema_details.get('properties', {})
-        required = schema_details.get('required', [])
-        merged_properties, merged_required, merged_references = merge_all_of_schemas(schema_details.get('allOf', []), openapi_spec)
-        properties.update(merged_properties)
-        required = list(set(required + merged_required))
-        return process_properties(properties, required, merged_references, openapi_spec, expand_list)
+        return process_properties(node.merged_properties, node.merged_required, node.references, openapi_spec, expand_list)
     elif schema_type == 'array':
-        array_complex = ET.Element('xs:complexType')
-        seq = ET.SubElement(array_complex, 'xs:sequence')
-        items = schema_details.get('items', {})
-        if '$ref' in items:
-            ref_name = items['$ref'].split('/')[-1]
+        array_complex = ET.Element(XS_COMPLEX_TYPE)
+        seq = ET.SubElement(array_complex, XS_SEQUENCE)
+        items = node.items
+        ref_name = node.items_ref
+        if ref_name is not None:
             if ref_name in expand_list:
                 inlined = inline_schema(ref_name, openapi_spec, expand_list)
-                item_elem = ET.Element('xs:element', name="item", minOccurs="1", maxOccurs="unbounded")
+                item_elem = ET.SubElement(seq, XS_ELEMENT, {'name': "item", 'minOccurs': "1", 'maxOccurs': UNBOUNDED})
                 item_elem.append(inlined)
-                seq.append(item_elem)
             else:
-                seq.append(ET.Element('xs:element', name="item", type=ref_name, minOccurs="1", maxOccurs="unbounded"))
+                ET.SubElement(seq, XS_ELEMENT, {'name': "item", 'type': ref_name, 'minOccurs': "1", 'maxOccurs': UNBOUNDED})
         else:
             item_type = items.get('type', 'string')
             if item_type == 'string' and 'enum' in items:
-                enum_elem = create_enum_restriction('xs:string', items['enum'])
-                item_elem = ET.Element('xs:element', name="item", minOccurs="1", maxOccurs="unbounded")
+                enum_elem = create_enum_restriction(XS_STRING, items['enum'])
+                item_elem = ET.SubElement(seq, XS_ELEMENT, {'name': "item", 'minOccurs': "1", 'maxOccurs': UNBOUNDED})
                 item_elem.append(enum_elem)
-                seq.append(item_elem)
             elif item_type == 'object':
-                item_properties = items.get('properties', {})
-                item_required = items.get('required', [])
-                _, _, item_refs = merge_all_of_schemas(items.get('allOf', []), openapi_spec)
-                item_complex = process_properties(item_properties, item_required, item_refs, openapi_spec, expand_list)
-                item_elem = ET.Element('xs:element', name="item", minOccurs="1", maxOccurs="unbounded")
-                item_elem.append(item_complex)
-                seq.append(item_elem)
+                item_properties = items.get('properties', _EMPTY)
+                item_required = items.get('required', ())
+                _, _, item_refs = merge_all_of_schemas(items.get('allOf', ()), openapi_spec)
+                item_elem = ET.SubElement(seq, XS_ELEMENT, {'name': "item", 'minOccurs': "1", 'maxOccurs': UNBOUNDED})
+                process_properties(item_properties, item_required, item_refs, openapi_spec, expand_list, item_elem)
             else:
-                xsd_type = yaml_type_to_xsd_type(item_type)
-                seq.append(ET.Element('xs:element', name="item", type=xsd_type, minOccurs="1", maxOccurs="unbounded"))
+                xsd_type = YAML_TO_XSD_TYPES.get(item_type, XS_STRING)
+                ET.SubElement(seq, XS_ELEMENT, {'name': "item", 'type': xsd_type, 'minOccurs': "1", 'maxOccurs': UNBOUNDED})
         return array_complex
     else:
         # simple non-enum type
-        base_type = yaml_type_to_xsd_type(schema_type)
-        st = ET.Element('xs:simpleType')
-        ET.SubElement(st, 'xs:restriction', base=base_type)
+        base_type = YAML_TO_XSD_TYPES.get(schema_type, XS_STRING)
+        st = ET.Element(XS_SIMPLE_TYPE)
+        ET.SubElement(st, XS_RESTRICTION, {'base': base_type})
         return st
 
-def create_xsd_element(element_name, element_type=None, required=False, is_array=False, complex_type=None, enum_values=None):
-    elem = ET.Element('xs:element', name=element_name)
-    elem.set("minOccurs", "1" if required else "0")
-    if is_array:
-        elem.set("maxOccurs", "unbounded")
-
-    if enum_values:
-        elem.append(create_enum_restriction(element_type, enum_values))
-    elif complex_type is not None:
-        elem.append(complex_type)
-    else:
-        elem.set('type', element_type)
-    return elem
+# Resolved $ref targets, keyed by spec and ref path; cleared for every generated schema
+_ref_cache = {}
 
 def resolve_ref(ref_path, openapi_spec):
-    ref_parts = ref_path.strip('#/').split('/')
-    ref_schema = openapi_spec
-    for part in ref_parts:
-        ref_schema = ref_schema.get(part, {})
+    cache_key = (id(openapi_spec), ref_path)
+    ref_schema = _ref_cache.get(cache_key)
+    if ref_schema is not None:
+        return ref_schema
+    if ref_path.startswith(SCHEMA_REF_PREFIX) and ref_path.count('/') == 3:
+        # Nearly every ref points at a component schema, a single lookup by name
+        schemas = openapi_spec.get('components', _EMPTY).get('schemas', _EMPTY)
+        ref_schema = schemas.get(ref_name_from_path(ref_path), _EMPTY)
+    else:
+        ref_parts = ref_path.strip('#/').split('/')
+        ref_schema = openapi_spec
+        for part in ref_parts:
+            ref_schema = ref_schema.get(part, _EMPTY)
+    _ref_cache[cache_key] = ref_schema
     return ref_schema
 
-def process_simple_type(prop_name, prop_details, sequence, required_fields, openapi_spec, expand_list):
-    yaml_type = prop_details.get('type', 'string')
+# Leaf elements are built in place with SubElement and a literal attrib dict,
+# skipping the keyword-argument copy and the separate append
+def process_string_property(prop_name, prop_details, sequence, required_fields, openapi_spec, expand_list):
     is_required = prop_name in required_fields
+    enum_values = prop_details.get('enum')
+    if enum_values:
+        elem = ET.SubElement(sequence, XS_ELEMENT, {'name': prop_name, 'minOccurs': "1" if is_required else "0"})
+        elem.append(create_enum_restriction(XS_STRING, enum_values))
+    else:
+        ET.SubElement(sequence, XS_ELEMENT, {'name': prop_name, 'minOccurs': "1" if is_required else "0", 'type': XS_STRING})
 
-    if yaml_type == 'string' and 'enum' in prop_details:
-        enum_values = prop_details['enum']
-        sequence.append(create_xsd_element(prop_name, required=is_required, element_type='xs:string', enum_values=enum_values))
-    elif yaml_type == 'array':
-        items = prop_details.get('items', {})
-        if '$ref' in items:
-            ref_name = items['$ref'].split('/')[-1]
-            if ref_name in expand_list:
-                inlined = inline_schema(ref_name, openapi_spec, expand_list)
-                item_elem = ET.Element('xs:element', name=prop_name, minOccurs="1", maxOccurs="unbounded")
-                item_elem.append(inlined)
-                sequence.append(item_elem)
-            else:
-                sequence.append(ET.Element('xs:element', name=prop_name, type=ref_name, minOccurs="1", maxOccurs="unbounded"))
+def process_array_property(prop_name, prop_details, sequence, required_fields, openapi_spec, expand_list):
+    items = prop_details.get('items', _EMPTY)
+    if '$ref' in items:
+        ref_name = ref_name_from_path(items['$ref'])
+        if ref_name in expand_list:
+            inlined = inline_schema(ref_name, openapi_spec, expand_list)
+            item_elem = ET.SubElement(sequence, XS_ELEMENT, {'name': prop_name, 'minOccurs': "1", 'maxOccurs': UNBOUNDED})
+            item_elem.append(inlined)
         else:
-            item_type = items.get('type', 'string')
-            if item_type == 'string' and 'enum' in items:
-                enum_elem = create_enum_restriction('xs:string', items['enum'])
-                item_elem = ET.Element('xs:element', name=prop_name, minOccurs="1", maxOccurs="unbounded")
-                item_elem.append(enum_elem)
-                sequence.append(item_elem)
-            elif item_type == 'object':
-                item_properties = items.get('properties', {})
-                item_required = items.get('required', [])
-                _, _, item_refs = merge_all_of_schemas(items.get('allOf', []), openapi_spec)
-                item_complex = process_properties(item_properties, item_required, item_refs, openapi_spec, expand_list)
-                item_elem = ET.Element('xs:element', name=prop_name, minOccurs="1", maxOccurs="unbounded")
-                item_elem.append(item_complex)
-                sequence.append(item_elem)
-            else:
-                xsd_type = yaml_type_to_xsd_type(item_type)
-                sequence.append(ET.Element('xs:element', name=prop_name, type=xsd_type, minOccurs="1", maxOccurs="unbounded"))
-    elif yaml_type == 'object':
-        nested_properties = prop_details.get('properties', {})
-        nested_required = prop_details.get('required', [])
-        _, _, nested_refs = merge_all_of_schemas(prop_details.get('allOf', []), openapi_spec)
-        nested_complex_type = process_properties(nested_properties, nested_required, nested_refs, openapi_spec, expand_list)
-        sequence.append(create_xsd_element(prop_name, required=is_required, complex_type=nested_complex_type))
+            ET.SubElement(sequence, XS_ELEMENT, {'name': prop_name, 'type': ref_name, 'minOccurs': "1", 'maxOccurs': UNBOUNDED})
     else:
-        xsd_type = yaml_type_to_xsd_type(yaml_type)
-        sequence.append(create_xsd_element(prop_name, required=is_required, element_type=xsd_type))
+        item_type = items.get('type', 'string')
+        if item_type == 'string' and 'enum' in items:
+            enum_elem = create_enum_restriction(XS_STRING, items['enum'])
+            item_elem = ET.SubElement(sequence, XS_ELEMENT, {'name': prop_name, 'minOccurs': "1", 'maxOccurs': UNBOUNDED})
+            item_elem.append(enum_elem)
+        elif item_type == 'object':
+            item_properties = items.get('properties', _EMPTY)
+            item_required = items.get('required', ())
+            _, _, item_refs = merge_all_of_schemas(items.get('allOf', ()), openapi_spec)
+            item_elem = ET.SubElement(sequence, XS_ELEMENT, {'name': prop_name, 'minOccurs': "1", 'maxOccurs': UNBOUNDED})
+            process_properties(item_properties, item_required, item_refs, openapi_spec, expand_list, item_elem)
+        else:
+            xsd_type = YAML_TO_XSD_TYPES.get(item_type, XS_STRING)
+            ET.SubElement(sequence, XS_ELEMENT, {'name': prop_name, 'type': xsd_type, 'minOccurs': "1", 'maxOccurs': UNBOUNDED})
+
+def process_object_property(prop_name, prop_details, sequence, required_fields, openapi_spec, expand_list):
+    is_required = prop_name in required_fields
+    nested_properties = prop_details.get('properties', _EMPTY)
+    nested_required = prop_details.get('required', ())
+    _, _, nested_refs = merge_all_of_schemas(prop_details.get('allOf', ()), openapi_spec)
+    elem = ET.SubElement(sequence, XS_ELEMENT, {'name': prop_name, 'minOccurs': "1" if is_required else "0"})
+    process_properties(nested_properties, nested_required, nested_refs, openapi_spec, expand_list, elem)
+
+def process_scalar_property(prop_name, prop_details, sequence, required_fields, openapi_spec, expand_list):
+    is_required = prop_name in required_fields
+    xsd_type = YAML_TO_XSD_TYPES.get(prop_details['type'], XS_STRING)
+    ET.SubElement(sequence, XS_ELEMENT, {'name': prop_name, 'minOccurs': "1" if is_required else "0", 'type': xsd_type})
+
+# Property handlers by OpenAPI type; anything else is mapped to a plain XSD type
+PROPERTY_TYPE_HANDLERS = {
+    'string': process_string_property,
+    'array': process_array_property,
+    'object': process_object_property,
+}
 
 def process_any_of(prop_name, prop_details, sequence, openapi_spec, expand_list):
-    choice_element = ET.Element('xs:choice')
-    anyof_options = prop_details['anyOf']
+    choice_element = ET.Element(XS_CHOICE)
+    anyof_options = flatten_composition(prop_details['anyOf'], 'anyOf')
     for i, option in enumerate(anyof_options):
         option_element_name = f"{prop_name}_option{i}"
         if '$ref' in option:
-            ref_name = option['$ref'].split('/')[-1]
+            ref_name = ref_name_from_path(option['$ref'])
             if ref_name in expand_list:
                 inlined = inline_schema(ref_name, openapi_spec, expand_list)
-                opt_elem = ET.Element('xs:element', name=option_element_name, minOccurs="1")
+                opt_elem = ET.SubElement(choice_element, XS_ELEMENT, {'name': option_element_name, 'minOccurs': "1"})
                 opt_elem.append(inlined)
-                choice_element.append(opt_elem)
             else:
-                choice_element.append(ET.Element('xs:element', name=option_element_name, type=ref_name, minOccurs="1"))
+                ET.SubElement(choice_element, XS_ELEMENT, {'name': option_element_name, 'type': ref_name, 'minOccurs': "1"})
         else:
             yaml_type = option.get('type', 'string')
-            xsd_type = yaml_type_to_xsd_type(yaml_type)
-            choice_element.append(ET.Element('xs:element', name=option_element_name, type=xsd_type, minOccurs="1"))
-    elem = ET.Element('xs:element', name=prop_name, minOccurs="1")
+            xsd_type = YAML_TO_XSD_TYPES.get(yaml_type, XS_STRING)
+            ET.SubElement(choice_element, XS_ELEMENT, {'name': option_element_name, 'type': xsd_type, 'minOccurs': "1"})
+    elem = ET.SubElement(sequence, XS_ELEMENT, {'name': prop_name, 'minOccurs': "1"})
     elem.append(choice_element)
-    sequence.append(elem)
 
-def process_properties(properties, required_fields, references, openapi_spec, expand_list):
-    complex_type = ET.Element('xs:complexType')
-    sequence = ET.SubElement(complex_type, 'xs:sequence')
+def process_properties(properties, required_fields, references, openapi_spec, expand_list, parent=None):
+    if not isinstance(required_fields, (set, frozenset)):
+        required_fields = frozenset(required_fields)
+    # Built straight under the parent when there is one, instead of being moved there afterwards
+    complex_type = ET.Element(XS_COMPLEX_TYPE) if parent is None else ET.SubElement(parent, XS_COMPLEX_TYPE)
+    sequence = ET.SubElement(complex_type, XS_SEQUENCE)
+    handler_for = PROPERTY_TYPE_HANDLERS.get
 
     for prop_name, prop_details in properties.items():
         if 'allOf' in prop_details:
             merged_properties, merged_required, merged_references = merge_all_of_schemas(prop_details['allOf'], openapi_spec)
-            merged_properties.update(prop_details.get('properties', {}))
-            merged_required = list(set(merged_required + prop_details.get('required', [])))
-            nested_complex_type = process_properties(merged_properties, merged_required, merged_references, openapi_spec, expand_list)
-            sequence.append(create_xsd_element(prop_name, required=True, complex_type=nested_complex_type))
+            merged_properties = {**merged_properties, **prop_details.get('properties', _EMPTY)}
+            merged_required = merged_required.union(prop_details.get('required', ()))
+            elem = ET.SubElement(sequence, XS_ELEMENT, {'name': prop_name, 'minOccurs': "1"})
+            process_properties(merged_properties, merged_required, merged_references, openapi_spec, expand_list, elem)
         elif 'anyOf' in prop_details:
             process_any_of(prop_name, prop_details, sequence, openapi_spec, expand_list)
         elif '$ref' in prop_details:
-            ref_name = prop_details['$ref'].split('/')[-1]
+            ref_name = ref_name_from_path(prop_details['$ref'])
             if ref_name in expand_list:
                 # Inline
                 inlined = inline_schema(ref_name, openapi_spec, expand_list)
-                prop_elem = ET.Element('xs:element', name=prop_name, minOccurs="1")
+                prop_elem = ET.SubElement(sequence, XS_ELEMENT, {'name': prop_name, 'minOccurs': "1"})
                 prop_elem.append(inlined)
-                sequence.append(prop_elem)
             else:
-                sequence.append(ET.Element('xs:element', name=prop_name, type=ref_name, minOccurs="1"))
+                ET.SubElement(sequence, XS_ELEMENT, {'name': prop_name, 'type': ref_name, 'minOccurs': "1"})
         else:
-            process_simple_type(prop_name, prop_details, sequence, required_fields, openapi_spec, expand_list)
+            # Plain typed properties are the common case, dispatch straight to their handler
+            handler = handler_for(prop_details.get('type', 'string'), process_scalar_property)
+            handler(prop_name, prop_details, sequence, required_fields, openapi_spec, expand_list)
 
     return complex_type
 
-def generate_global_xsd_types(openapi_spec, root, exclude_types, include_types, expand_list):
-    schemas = openapi_spec.get('components', {}).get('schemas', {})
+def iter_global_schema_names(openapi_spec, exclude_types, include_types):
+    schemas = openapi_spec.get('components', _EMPTY).get('schemas', _EMPTY)
     schema_names_to_process = include_types if include_types else schemas.keys()
-
-    # global definitions are always not expanded here; expansions occur at usage time
     for schema_name in schema_names_to_process:
         if schema_name not in schemas:
             continue
         if schema_name in exclude_types:
             continue
-        schema_details = schemas[schema_name]
-        schema_type = schema_details.get('type', 'object')
-        if schema_type == 'string' and 'enum' in schema_details:
-            simple_type = ET.SubElement(root, 'xs:simpleType', name=schema_name)
-            enum_restriction = create_enum_restriction('xs:string', schema_details['enum'])
-            simple_type.append(enum_restriction)
-        else:
-            complex_type = ET.SubElement(root, 'xs:complexType', name=schema_name)
-            properties = schema_details.get('properties', {})
-            required_fields = schema_details.get('required', [])
-            _, _, references = merge_all_of_schemas(schema_details.get('allOf', []), openapi_spec)
-            processed_complex_type = process_properties(properties, required_fields, references, openapi_spec, expand_list)
-            complex_type.extend(processed_complex_type)
-
-def generate_xsd_from_openapi(openapi_spec, output_stream, exclude_request_body_types, exclude_list, include_list, expand_list):
-    if include_list:
-        exclude_types = set()
-    else:
-        request_body_only_types = find_request_body_only_types(openapi_spec) if exclude_request_body_types else set()
-        exclude_types = request_body_only_types.union(exclude_list)
+        # Shared with the interned names taken from $ref strings
+        yield sys.intern(schema_name)
+
+def build_global_xsd_type(schema_name, openapi_spec, expand_list):
+    node = get_schema_node(schema_name, openapi_spec)
+    if node.type == 'string' and node.enum is not None:
+        simple_type = ET.Element(XS_SIMPLE_TYPE, {'name': schema_name})
+        enum_restriction = create_enum_restriction(XS_STRING, node.enum)
+        simple_type.append(enum_restriction)
+        return simple_type
+    complex_type = process_properties(node.properties, node.required, node.references, openapi_spec, expand_list)
+    complex_type.set('name', schema_name)
+    return complex_type
+
+def iter_schema_children(openapi_spec, exclude_types, include_list, expand_list, inline_only=frozenset()):
+    # global definitions are always not expanded here; expansions occur at usage time
+    schema_names = list(iter_global_schema_names(openapi_spec, exclude_types, include_list))
+    global_types = {}
+    for schema_name in schema_names:
+        if schema_name not in inline_only:
+            global_types[schema_name] = build_global_xsd_type(schema_name, openapi_spec, expand_list)
+    # Types expanded only for being rarely referenced are left out once the other types have inlined
+    # them; one that nothing emitted inlines, e.g. used only by an excluded type, keeps its definition
+    for schema_name in schema_names:
+        if schema_name in inline_only and not is_inlined(schema_name, openapi_spec, expand_list):
+            global_types[schema_name] = build_global_xsd_type(schema_name, openapi_spec, expand_list)
+    emitted = [schema_name for schema_name in schema_names if schema_name in global_types]
+    for schema_name in emitted:
+        yield global_types[schema_name]
+    for schema_name in emitted:
+        yield ET.Element(XS_ELEMENT, {'name': schema_name, 'type': schema_name})
+
+def write_xsd(openapi_spec, output_stream, exclude_types, include_list, expand_list, inline_only=frozenset(), pretty_print=True):
+    # The tree is built whole and written with one call. Serializing each global type on its own
+    # saved a few hundred KB of peak memory but was twice as slow on the stdlib backend
+    root = ET.Element(XS_SCHEMA, XS_SCHEMA_ATTRIB)
+    root.extend(iter_schema_children(openapi_spec, exclude_types, include_list, expand_list, inline_only))
+    tree = ET.ElementTree(root)
+    if pretty_print:
+        ET.indent(tree, space="  ", level=0)
+    output_stream.write(b'<?xml version="1.0" encoding="UTF-8"?>\n')
+    tree.write(output_stream, encoding='UTF-8', xml_declaration=False)
 
-    root = ET.Element('xs:schema', xmlns_xs="http://www.w3.org/2001/XMLSchema", elementFormDefault="qualified")
+def clear_caches():
+    _ref_cache.clear()
+    _schema_node_cache.clear()
+    _all_of_cache.clear()
+    _inline_cache.clear()
+    _enum_cache.clear()
+    _ref_names.clear()
 
-    generate_global_xsd_types(openapi_spec, root, exclude_types, include_list, expand_list)
+def prepare_expand_list(openapi_spec, expand_list, inline_threshold=0):
+    # Checked before the output is opened, so a rejected expansion leaves no partial file behind
+    clear_caches()
+    # Tested at every $ref and handed down through every builder, so fixed as a frozenset once
+    expand_list = frozenset(expand_list or ())
+    # Types expanded for the threshold alone replace their global definition, listed ones keep it
+    inline_only = frozenset()
+    if inline_threshold > 0:
+        inline_only = frozenset(find_rarely_referenced_types(openapi_spec, inline_threshold)).difference(expand_list)
+        expand_list = expand_list.union(inline_only)
+    cycle = find_expansion_cycle(openapi_spec, expand_list)
+    if cycle:
+        raise ExpansionCycleError("Cannot expand recursive types inline: %s" % " -> ".join(cycle))
+    return expand_list, inline_only
 
-    schemas = openapi_spec.get('components', {}).get('schemas', {})
+def write_xsd_for_openapi(openapi_spec, output_stream, exclude_request_body_types, exclude_list, include_list, expand_list, inline_only=frozenset(), pretty_print=True):
+    # expand_list and inline_only are the frozensets returned by prepare_expand_list for the same spec
     if include_list:
-        for schema_name in include_list:
-            if schema_name in schemas and schema_name not in exclude_types:
-                ET.SubElement(root, 'xs:element', name=schema_name, type=schema_name)
+        exclude_types = frozenset()
     else:
-        for schema_name in schemas.keys():
-            if schema_name not in exclude_types:
-                ET.SubElement(root, 'xs:element', name=schema_name, type=schema_name)
+        request_body_only_types = find_request_body_only_types(openapi_spec) if exclude_request_body_types else set()
+        exclude_types = frozenset(request_body_only_types.union(exclude_list))
 
-    tree = ET.ElementTree(root)
-    ET.indent(tree, space="  ", level=0)
-    output_stream.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-    tree.write(output_stream, encoding='unicode', method="xml")
+    try:
+        if isinstance(output_stream, io.TextIOBase):
+            # The schema is written as UTF-8 bytes; text streams such as sys.stdout get them
+            # through their underlying buffer, in-memory ones like StringIO as decoded text
+            byte_stream = getattr(output_stream, 'buffer', None)
+            if byte_stream is not None:
+                output_stream.flush()
+                write_xsd(openapi_spec, byte_stream, exclude_types, include_list, expand_list, inline_only, pretty_print)
+                byte_stream.flush()
+            else:
+                byte_stream = io.BytesIO()
+                write_xsd(openapi_spec, byte_stream, exclude_types, include_list, expand_list, inline_only, pretty_print)
+                output_stream.write(byte_stream.getvalue().decode('utf-8'))
+        else:
+            write_xsd(openapi_spec, output_stream, exclude_types, include_list, expand_list, inline_only, pretty_print)
+    finally:
+        # The caches hold parts of the spec and built subtrees, drop them once the schema is written
+        clear_caches()
+
+def generate_xsd_from_openapi(openapi_spec, output_stream, exclude_request_body_types, exclude_list, include_list, expand_list, inline_threshold=0, pretty_print=True):
+    expand_list, inline_only = prepare_expand_list(openapi_spec, expand_list, inline_threshold)
+    write_xsd_for_openapi(openapi_spec, output_stream, exclude_request_body_types, exclude_list, include_list, expand_list, inline_only, pretty_print)
+
+OUTPUT_BUFFER_SIZE = 1 << 20
 
 def main():
     parser = argparse.ArgumentParser(description='Convert OpenAPI to XSD with optional expansions.')
@@ -308,18 +667,62 @@ def main():
     parser.add_argument('--exclude', help='Comma-separated list or file of object names to exclude')
     parser.add_argument('--include', help='Comma-separated list or file of object names to include (overrides exclude logic)')
     parser.add_argument('--expand', help='Comma-separated list or file of object names to expand inline')
+    parser.add_argument('--inline-threshold', type=int, default=0, help='Inline non-recursive types referenced at most this many times instead of emitting them as global types')
+    parser.add_argument('--no-pretty-print', dest='pretty_print', action='store_false', help='Write the XSD without indentation')
+    parser.add_argument('--batch', metavar='DIR', help='Convert every .yaml, .yml and .json file in DIR to a .xsd file in the output directory (defaults to DIR)')
     args = parser.parse_args()
+    if args.batch and args.input:
+        parser.error('--batch cannot be combined with -i/--input')
 
-    openapi_spec = load_openapi_from_file_or_stdin(args.input)
     exclude_list = load_list_from_input(args.exclude)
     include_list = load_list_from_input(args.include)
     expand_list = load_list_from_input(args.expand)
 
+    # Output goes through one large buffer, even when Python runs with unbuffered streams
+    if args.batch:
+        # One process for all specs, so interpreter start-up and imports are paid once
+        if not os.path.isdir(args.batch):
+            parser.error(f"--batch: {args.batch} is not a directory")
+        output_dir = args.output or args.batch
+        sources_by_output = {}
+        for file_name in sorted(os.listdir(args.batch)):
+            base_name, extension = os.path.splitext(file_name)
+            if extension.lower() not in ('.yaml', '.yml', '.json'):
+                continue
+            output_name = base_name + '.xsd'
+            if output_name in sources_by_output:
+                parser.error(f"{sources_by_output[output_name]} and {file_name} would both be written to {output_name}")
+            sources_by_output[output_name] = file_name
+        try:
+            os.makedirs(output_dir, exist_ok=True)
+        except OSError as error:
+            parser.error(f"cannot create output directory {output_dir}: {error.strerror}")
+        for output_name, file_name in sources_by_output.items():
+            openapi_spec = load_openapi_from_file_or_stdin(os.path.join(args.batch, file_name))
+            try:
+                spec_expand_list, inline_only = prepare_expand_list(openapi_spec, expand_list, args.inline_threshold)
+            except ExpansionCycleError as error:
+                parser.error(f"{file_name}: {error}")
+            with open(os.path.join(output_dir, output_name), 'wb', buffering=OUTPUT_BUFFER_SIZE) as output_file:
+                write_xsd_for_openapi(openapi_spec, output_file, args.exclude_request_body_types, exclude_list, include_list, spec_expand_list, inline_only, args.pretty_print)
+        return
+
+    openapi_spec = load_openapi_from_file_or_stdin(args.input)
+    try:
+        expand_list, inline_only = prepare_expand_list(openapi_spec, expand_list, args.inline_threshold)
+    except ExpansionCycleError as error:
+        parser.error(str(error))
     if args.output:
-        with open(args.output, 'w') as output_file:
-            generate_xsd_from_openapi(openapi_spec, output_file, args.exclude_request_body_types, exclude_list, include_list, expand_list)
+        with open(args.output, 'wb', buffering=OUTPUT_BUFFER_SIZE) as output_file:
+            write_xsd_for_openapi(openapi_spec, output_file, args.exclude_request_body_types, exclude_list, include_list, expand_list, inline_only, args.pretty_print)
     else:
-        generate_xsd_from_openapi(openapi_spec, sys.stdout, args.exclude_request_body_types, exclude_list, include_list, expand_list)
+        sys.stdout.flush()
+        output_stream = io.BufferedWriter(sys.stdout.buffer, OUTPUT_BUFFER_SIZE)
+        try:
+            write_xsd_for_openapi(openapi_spec, output_stream, args.exclude_request_body_types, exclude_list, include_list, expand_list, inline_only, args.pretty_print)
+        finally:
+            # Flushes and lets go of stdout, which closing the wrapper would close as well
+            output_stream.detach()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,328 @@
+import io
+import os
+import sys
+import json
+import tempfile
+import unittest
+from unittest import mock
+import xml.etree.ElementTree as StdET
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import oas2xsd
+
+SPEC_FILE = os.path.join(ROOT, 'openapi_ss12000_version2_1_0.yaml')
+DATA_DIR = os.path.join(ROOT, 'tests', 'data')
+EXPAND_LIST = frozenset([
+    'Meta', 'Person_civicNo', 'Email', 'SchoolTypesEnum', 'OrganisationTypeEnum',
+    'Organisation_address', 'OrganisationReference', 'PersonReference', 'GroupReference',
+])
+
+XS_ELEMENT_TAG = '{http://www.w3.org/2001/XMLSchema}element'
+
+_spec = None
+
+def load_spec():
+    global _spec
+    if _spec is None:
+        _spec = oas2xsd.load_openapi_from_file_or_stdin(SPEC_FILE)
+    return _spec
+
+def convert(openapi_spec, exclude_request_body_types=False, exclude_list=frozenset(), include_list=frozenset(), expand_list=frozenset(), **options):
+    output = io.BytesIO()
+    oas2xsd.generate_xsd_from_openapi(openapi_spec, output, exclude_request_body_types, exclude_list, include_list, expand_list, **options)
+    return output.getvalue()
+
+def canonical(xml_bytes):
+    return StdET.canonicalize(xml_bytes.decode('utf-8'), strip_text=True)
+
+def canonical_file(path):
+    return StdET.canonicalize(from_file=path, strip_text=True)
+
+class BaselineOutputTest(unittest.TestCase):
+    # The expected files are the output of the original script, with its xmlns_xs attribute
+    # corrected to a namespace declaration
+
+    def test_default_output_matches_baseline(self):
+        output = convert(load_spec())
+        self.assertEqual(canonical(output), canonical_file(os.path.join(DATA_DIR, 'ss12000.xsd')))
+
+    def test_expanded_output_matches_baseline(self):
+        output = convert(load_spec(), expand_list=EXPAND_LIST)
+        self.assertEqual(canonical(output), canonical_file(os.path.join(DATA_DIR, 'ss12000_expanded.xsd')))
+
+    def test_xml_declaration_matches_baseline(self):
+        # Canonicalization drops the declaration, so its bytes are compared separately
+        output = convert(load_spec())
+        with open(os.path.join(DATA_DIR, 'ss12000.xsd'), 'rb') as file:
+            self.assertEqual(output.partition(b'\n')[0], file.readline().rstrip(b'\n'))
+
+    def test_compact_output_matches_baseline(self):
+        output = convert(load_spec(), pretty_print=False)
+        self.assertEqual(canonical(output), canonical_file(os.path.join(DATA_DIR, 'ss12000.xsd')))
+
+    def test_text_streams_are_accepted(self):
+        expected = convert(load_spec())
+        text_output = io.StringIO()
+        oas2xsd.generate_xsd_from_openapi(load_spec(), text_output, False, frozenset(), frozenset(), frozenset())
+        self.assertEqual(text_output.getvalue(), expected.decode('utf-8'))
+        byte_output = io.BytesIO()
+        wrapper = io.TextIOWrapper(byte_output, encoding='utf-8')
+        oas2xsd.generate_xsd_from_openapi(load_spec(), wrapper, False, frozenset(), frozenset(), frozenset())
+        self.assertEqual(byte_output.getvalue(), expected)
+
+    def test_namespace_declared_once(self):
+        output = convert(load_spec())
+        self.assertEqual(output.count(b'xmlns:xs='), 1)
+
+def schema_ref(name):
+    return {'$ref': '#/components/schemas/' + name}
+
+def json_content(schema):
+    return {'content': {'application/json': {'schema': schema}}}
+
+class RequestBodyOnlyTypesTest(unittest.TestCase):
+
+    def setUp(self):
+        schemas = {name: {'type': 'object', 'properties': {'id': {'type': 'string'}}}
+                   for name in ('Input', 'Shared', 'PathParam', 'OperationParam', 'ResponseRef', 'Output')}
+        self.spec = {
+            'paths': {
+                '/things': {
+                    'parameters': [{'name': 'filter', 'in': 'query', 'schema': schema_ref('PathParam')}],
+                    'post': {
+                        'requestBody': {'content': {
+                            'application/json': {'schema': schema_ref('Input')},
+                            'text/plain': {'schema': schema_ref('ResponseRef')},
+                        }},
+                        'responses': {'201': json_content(schema_ref('Output'))},
+                    },
+                    'put': {
+                        'requestBody': json_content(schema_ref('Shared')),
+                        'responses': {'200': json_content({'type': 'array', 'items': schema_ref('Shared')})},
+                    },
+                },
+                '/things/{id}': {
+                    'summary': 'A single thing',
+                    'patch': {
+                        'parameters': [{'$ref': '#/components/parameters/Selector'}],
+                        'requestBody': {'$ref': '#/components/requestBodies/Patch'},
+                        'responses': {'200': {'$ref': '#/components/responses/Patched'}},
+                    },
+                    'delete': {
+                        'requestBody': json_content(schema_ref('PathParam')),
+                        'responses': {'204': {'description': 'Deleted'}},
+                    },
+                },
+            },
+            'components': {
+                'schemas': schemas,
+                'parameters': {'Selector': {'name': 'selector', 'in': 'query', 'schema': schema_ref('OperationParam')}},
+                'requestBodies': {'Patch': json_content(schema_ref('OperationParam'))},
+                'responses': {'Patched': json_content(schema_ref('ResponseRef'))},
+            },
+        }
+
+    def test_types_also_used_outside_request_bodies_are_kept(self):
+        self.assertEqual(oas2xsd.find_request_body_only_types(self.spec), {'Input'})
+
+    def test_excluded_types_are_left_out_of_the_schema(self):
+        output = convert(self.spec, exclude_request_body_types=True)
+        names = {child.get('name') for child in StdET.fromstring(output)}
+        self.assertEqual(names, {'Shared', 'PathParam', 'OperationParam', 'ResponseRef', 'Output'})
+
+class ExpansionCycleTest(unittest.TestCase):
+
+    def spec(self, **schemas):
+        return {'paths': {}, 'components': {'schemas': schemas}}
+
+    def test_back_references_that_are_not_inlined_are_allowed(self):
+        # Child refers back to Parent only through an allOf base and additionalProperties,
+        # neither of which the builders inline
+        spec = self.spec(
+            Parent={'type': 'object', 'properties': {'child': schema_ref('Child')}},
+            Child={
+                'type': 'object',
+                'allOf': [schema_ref('Parent')],
+                'properties': {'name': {'type': 'string'}},
+                'additionalProperties': schema_ref('Parent'),
+            },
+        )
+        self.assertIsNone(oas2xsd.find_expansion_cycle(spec, {'Parent', 'Child'}))
+        output = convert(spec, expand_list={'Parent', 'Child'})
+        self.assertIn(b'name="name"', output)
+
+    def test_inlined_cycle_is_rejected(self):
+        spec = self.spec(
+            Parent={'type': 'object', 'properties': {'children': {'type': 'array', 'items': schema_ref('Child')}}},
+            Child={'type': 'object', 'properties': {'parent': schema_ref('Parent')}},
+        )
+        with self.assertRaisesRegex(oas2xsd.ExpansionCycleError, 'Child -> Parent -> Child'):
+            convert(spec, expand_list={'Parent', 'Child'})
+
+    def test_cycle_through_a_type_that_is_not_expanded_is_allowed(self):
+        spec = self.spec(
+            Parent={'type': 'object', 'properties': {'child': schema_ref('Child')}},
+            Child={'type': 'object', 'properties': {'parent': schema_ref('Parent')}},
+        )
+        output = convert(spec, expand_list={'Child'})
+        self.assertIn(b'type="Parent"', output)
+
+class InlineThresholdTest(unittest.TestCase):
+
+    def setUp(self):
+        def object_schema(**properties):
+            return {'type': 'object', 'properties': properties}
+        self.spec = {'paths': {}, 'components': {'schemas': {
+            'Root': {
+                'type': 'object',
+                'allOf': [schema_ref('Base')],
+                'properties': {'leaf': schema_ref('Leaf'), 'first': schema_ref('Shared'), 'second': schema_ref('Shared')},
+            },
+            'Leaf': object_schema(name={'type': 'string'}),
+            'Shared': object_schema(id={'type': 'string'}),
+            'Base': object_schema(code={'type': 'string'}),
+            'Excluded': object_schema(orphan=schema_ref('Orphan')),
+            'Orphan': object_schema(value={'type': 'string'}),
+        }}}
+
+    def global_names(self, output):
+        return [child.get('name') for child in StdET.fromstring(output) if child.tag != XS_ELEMENT_TAG]
+
+    def test_inlined_types_are_not_emitted_again(self):
+        output = convert(self.spec, exclude_list={'Excluded'}, inline_threshold=1)
+        # Base is only an allOf base and Orphan only used by an excluded type, neither is inlined
+        self.assertEqual(self.global_names(output), ['Root', 'Shared', 'Base', 'Orphan'])
+        root = StdET.fromstring(output)
+        self.assertEqual([child.get('name') for child in root if child.tag == XS_ELEMENT_TAG], ['Root', 'Shared', 'Base', 'Orphan'])
+        leaf = root.find(".//*[@name='leaf']")
+        self.assertIsNone(leaf.get('type'))
+        self.assertIsNotNone(leaf.find(".//*[@name='name']"))
+
+    def test_listed_expansions_keep_their_definition(self):
+        output = convert(self.spec, expand_list={'Leaf'}, inline_threshold=1)
+        self.assertIn('Leaf', self.global_names(output))
+
+    def test_inlining_single_use_types_shrinks_the_schema(self):
+        # Compared without indentation, which grows with every level of nesting
+        inlined = convert(load_spec(), inline_threshold=1, pretty_print=False)
+        self.assertLess(len(inlined), len(convert(load_spec(), pretty_print=False)))
+
+class FlattenCompositionTest(unittest.TestCase):
+
+    def test_own_properties_take_precedence_over_nested_all_of_members(self):
+        member = {
+            'allOf': [{'properties': {'code': {'type': 'integer'}, 'extra': {'type': 'boolean'}}, 'required': ['extra']}],
+            'properties': {'code': {'type': 'string'}},
+        }
+        merged_properties, merged_required, _ = oas2xsd.merge_all_of_schemas([member], {})
+        self.assertEqual(merged_properties, {'code': {'type': 'string'}, 'extra': {'type': 'boolean'}})
+        self.assertEqual(merged_required, {'extra'})
+
+    def test_nested_any_of_options_are_hoisted_in_order(self):
+        options = [{'type': 'integer'}, {'anyOf': [{'type': 'boolean'}, schema_ref('Thing')]}]
+        self.assertEqual(oas2xsd.flatten_composition(options, 'anyOf'), [{'type': 'integer'}, {'type': 'boolean'}, schema_ref('Thing')])
+
+class LoadOpenapiTest(unittest.TestCase):
+
+    def load(self, document):
+        return oas2xsd.load_openapi_from_stream(io.BufferedReader(io.BytesIO(document)))
+
+    def test_json_document(self):
+        self.assertEqual(self.load(b' {"openapi": "3.0.0", "paths": {}}'), {'openapi': '3.0.0', 'paths': {}})
+
+    def test_yaml_flow_mapping(self):
+        spec = self.load(b'{openapi: 3.0.0, paths: {}, components: {schemas: {Thing: {type: string}}}}')
+        self.assertEqual(spec['components']['schemas'], {'Thing': {'type': 'string'}})
+
+    def test_yaml_block_mapping(self):
+        self.assertEqual(self.load(b'openapi: 3.0.0\npaths: {}\n'), {'openapi': '3.0.0', 'paths': {}})
+
+CYCLIC_SPEC = {
+    'openapi': '3.0.0',
+    'paths': {},
+    'components': {'schemas': {
+        'Parent': {'type': 'object', 'properties': {'child': schema_ref('Child')}},
+        'Child': {'type': 'object', 'properties': {'parent': schema_ref('Parent')}},
+    }},
+}
+
+class CommandLineTest(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.temp_dir = temp_dir.name
+
+    def write_file(self, name, content):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, 'w') as file:
+            file.write(content)
+        return path
+
+    def run_main(self, *args):
+        # Usage errors go to stderr and exit with status 2
+        stderr = io.StringIO()
+        with mock.patch.object(sys, 'argv', ['oas2xsd.py', *args]), mock.patch.object(sys, 'stderr', stderr):
+            try:
+                oas2xsd.main()
+            except SystemExit as system_exit:
+                return system_exit.code, stderr.getvalue()
+        return 0, stderr.getvalue()
+
+    def test_rejected_expansion_leaves_the_output_file_alone(self):
+        spec_file = self.write_file('spec.json', json.dumps(CYCLIC_SPEC))
+        output_file = self.write_file('out.xsd', 'previous')
+        status, error = self.run_main('-i', spec_file, '-o', output_file, '--expand', 'Parent,Child')
+        self.assertEqual(status, 2)
+        self.assertIn('Cannot expand recursive types inline', error)
+        with open(output_file) as file:
+            self.assertEqual(file.read(), 'previous')
+
+    def test_other_value_errors_are_not_reported_as_usage_errors(self):
+        output_file = os.path.join(self.temp_dir, 'out.xsd')
+        with mock.patch.object(oas2xsd, 'write_xsd', side_effect=ValueError('broken')):
+            with self.assertRaisesRegex(ValueError, 'broken'):
+                self.run_main('-i', SPEC_FILE, '-o', output_file)
+
+    def test_stdout_stays_usable_after_main(self):
+        stdout = io.TextIOWrapper(io.BytesIO(), encoding='utf-8')
+        with mock.patch.object(sys, 'argv', ['oas2xsd.py', '-i', SPEC_FILE]), mock.patch.object(sys, 'stdout', stdout):
+            oas2xsd.main()
+            self.assertFalse(stdout.buffer.closed)
+            print('done')
+        stdout.flush()
+        self.assertEqual(stdout.buffer.getvalue(), convert(load_spec()) + b'done\n')
+
+    def test_batch_writes_one_schema_per_spec(self):
+        spec = json.dumps({'openapi': '3.0.0', 'paths': {}, 'components': {'schemas': {'Thing': {'type': 'string'}}}})
+        self.write_file('one.yaml', spec)
+        self.write_file('two.JSON', spec)
+        self.write_file('notes.txt', 'not a spec')
+        output_dir = os.path.join(self.temp_dir, 'out', 'xsd')
+        self.assertEqual(self.run_main('--batch', self.temp_dir, '-o', output_dir), (0, ''))
+        self.assertEqual(sorted(os.listdir(output_dir)), ['one.xsd', 'two.xsd'])
+
+    def test_batch_rejects_sources_sharing_a_base_name(self):
+        self.write_file('spec.yaml', 'openapi: 3.0.0')
+        self.write_file('spec.json', '{"openapi": "3.0.0"}')
+        status, error = self.run_main('--batch', self.temp_dir)
+        self.assertEqual(status, 2)
+        self.assertIn('spec.json and spec.yaml would both be written to spec.xsd', error)
+        self.assertNotIn('spec.xsd', os.listdir(self.temp_dir))
+
+    def test_batch_reports_a_missing_directory(self):
+        status, error = self.run_main('--batch', os.path.join(self.temp_dir, 'missing'))
+        self.assertEqual(status, 2)
+        self.assertIn('is not a directory', error)
+
+    def test_batch_reports_an_output_path_that_is_a_file(self):
+        self.write_file('spec.yaml', 'openapi: 3.0.0')
+        output_file = self.write_file('out.xsd', '')
+        status, error = self.run_main('--batch', self.temp_dir, '-o', output_file)
+        self.assertEqual(status, 2)
+        self.assertIn('cannot create output directory', error)
+
+if __name__ == '__main__':
+    unittest.main()